@@ -1,15 +1,27 @@
 import os
 import uuid
-import json
+import hashlib
+import asyncio
 import logging
-from typing import List
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import tee
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
-import pdfplumber
+import fitz  # PyMuPDF
+import numpy as np
+import orjson
+from openai import AsyncOpenAI
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import (
+    Distance, VectorParams, OptimizersConfigDiff,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+)
 from dotenv import load_dotenv
 
 # Import Pydantic models for structured data
@@ -29,59 +41,186 @@ app = FastAPI(title="PDF Vectorizer Service")
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "pdf_collection")
+# Texts per request LangChain sends to the embeddings API, and how many
+# embedding calls may be in flight at once across the whole service
+EMBEDDING_BATCH_SIZE = 1000
+EMBEDDING_CONCURRENCY = 5
+# Points per Qdrant upload request; very large single upserts tend to time out
+UPSERT_BATCH_SIZE = 256
+# Documents that may upload to Qdrant at once across the whole service
+UPLOAD_CONCURRENCY = 2
+# HNSW indexing threshold (Qdrant's default); indexing is paused (0) during bulk loads
+INDEXING_THRESHOLD = 20000
+# Chunks embedded and upserted together as they flow through the ingestion
+# pipeline, and how many items each pipeline queue may hold
+PIPELINE_BATCH_SIZE = 100
+PIPELINE_QUEUE_SIZE = 8
+# text-embedding-3-small natively returns 1536 dims; the API can truncate them.
+# 512 dims keep most of the retrieval quality at a third of the storage and
+# distance-computation cost. Changing this requires recreating the collection.
+EMBEDDING_DIMENSIONS = 512
+# Documents with at least this many chunks are embedded through the OpenAI
+# Batch API (half the price, no per-request rate limits, completes within 24h)
+# and finished later via /finalize/{job_id}. Chunk payloads wait in
+# BATCH_JOBS_DIR meanwhile. 0 (the default) disables the Batch API, which
+# OpenAI-compatible endpoints set via OPENAI_API_BASE may not offer.
+BATCH_EMBEDDING_MIN_CHUNKS = int(os.getenv("BATCH_EMBEDDING_MIN_CHUNKS", 0))
+BATCH_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "/tmp/pdf_vectorizer_batches")
 
 # --- Clients ---
 # Initialize Qdrant Client
 qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+# Async client used by request handlers so Qdrant calls don't block the event loop
+async_qdrant_client = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
 
 # Initialize Embedding Model (AvalAI/OpenAI)
 # *** THIS LINE IS NOW CORRECTED ***
 embedding_model = OpenAIEmbeddings(
     model="text-embedding-3-small", 
+    dimensions=EMBEDDING_DIMENSIONS,
     openai_api_key=os.getenv("OPENAI_API_KEY"),
     # Use the custom base URL if defined in .env
     openai_api_base=os.getenv("OPENAI_API_BASE", None), 
+    chunk_size=EMBEDDING_BATCH_SIZE,
+)
+# Raw OpenAI client for the Batch API, which LangChain doesn't wrap
+openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_API_BASE", None),
+)
+
+# Text splitter shared across requests (it holds no per-call state)
+TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000, 
+    chunk_overlap=100,
+    separators=["\n\n", "\n", " ", ""], # Optimal separators for text flow
+    add_start_index=True, # Lets us map chunks of the joined document back to pages
 )
+# Inserted between pages so the splitter treats page breaks as paragraph breaks
+PAGE_SEPARATOR = "\n\n"
+# Page text is split as it accumulates, a window of a few chunks at a time
+TEXT_WINDOW_CHARS = 4000
+# Text chunks shorter than this (stray headers, page numbers, scan noise) carry
+# no useful meaning and are not embedded
+MIN_TEXT_CHUNK_CHARS = 32
+# PyMuPDF's find_tables keeps its working state in module globals, so pages of
+# different documents must not be parsed in several threads at once
+PDF_PARSE_LOCK = threading.Lock()
 
 # --- Qdrant Setup ---
 def init_qdrant():
-    """Ensure the collection exists on startup."""
+    """
+    Ensure the collection exists on startup. An existing collection must hold
+    vectors of EMBEDDING_DIMENSIONS; startup fails otherwise.
+    """
     try:
-        collections = qdrant_client.get_collections()
-        exists = any(c.name == COLLECTION_NAME for c in collections.collections)
-        
-        if not exists:
-            # Vector size for text-embedding-3-small is 1536
+        # A single lookup of our collection instead of listing all of them
+        if qdrant_client.collection_exists(COLLECTION_NAME):
+            vector_size = qdrant_client.get_collection(COLLECTION_NAME).config.params.vectors.size
+        else:
+            vector_size = EMBEDDING_DIMENSIONS
+            # Vector size must match the dimensions requested from the embedding API
             qdrant_client.create_collection(
                 collection_name=COLLECTION_NAME,
-                vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+                vectors_config=VectorParams(size=EMBEDDING_DIMENSIONS, distance=Distance.COSINE),
+                # Start with indexing disabled; it is enabled after the first upload
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+                # int8 scalar quantization: 4x less memory for the search index,
+                # with the original float32 vectors kept for rescoring
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+                ),
             )
             logger.info(f"Created Qdrant collection: {COLLECTION_NAME}")
     except Exception as e:
         logger.error(f"Failed to initialize Qdrant: {e}")
+        return
+
+    # A collection created before EMBEDDING_DIMENSIONS changed (e.g. with the
+    # native 1536 dims) would reject every upsert
+    if vector_size != EMBEDDING_DIMENSIONS:
+        raise RuntimeError(
+            f"Qdrant collection '{COLLECTION_NAME}' holds {vector_size}-dim vectors, "
+            f"but EMBEDDING_DIMENSIONS is {EMBEDDING_DIMENSIONS}. Delete the collection "
+            f"so it is recreated on startup, or set a new COLLECTION_NAME."
+        )
+
+# Shared by all requests so that concurrent uploads together stay within the
+# OpenAI and Qdrant limits. They are created on startup because on Python 3.9
+# asyncio primitives bind to the event loop that exists when they are built.
+embedding_semaphore: Optional[asyncio.Semaphore] = None
+upload_semaphore: Optional[asyncio.Semaphore] = None
+# Distinct texts whose vectors are kept per document for deduplication
+VECTOR_CACHE_SIZE = 2048
+# Number of bulk loads currently running with HNSW indexing paused
+indexing_pauses = 0
 
 @app.on_event("startup")
 async def startup_event():
+    global embedding_semaphore, upload_semaphore
+    embedding_semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
     init_qdrant()
 
 # --- Helper Functions ---
 
-def extract_content_from_pdf(file_path: str) -> List[ExtractedChunk]:
+def split_text_chunks(
+    text: str, page_starts: List[int], page_numbers: List[int], final: bool
+) -> Tuple[List[ExtractedChunk], int]:
     """
-    Parses PDF to extract Text and Tables while preserving page context.
-    Returns a list of ExtractedChunk Pydantic models.
+    Splits a window of joined page text into text chunks, attributing each
+    chunk to the page it starts on (page_starts are offsets into `text`).
+    Unless the window is the document's last, its final chunk may be cut
+    short by the window end, so it is held back.
+    Returns the chunks and the offset the next window should start from.
     """
+    documents = TEXT_SPLITTER.create_documents([text])
+    cut = len(text)
+    if not final:
+        if len(documents) < 2:
+            return [], 0
+        cut = documents.pop().metadata["start_index"]
+
     extracted_chunks: List[ExtractedChunk] = []
+    for document in documents:
+        idx = max(bisect_right(page_starts, document.metadata["start_index"]) - 1, 0)
+        # Collapse whitespace so repeated boilerplate dedupes to one text
+        chunk_text = " ".join(document.page_content.split())
+        if len(chunk_text) < MIN_TEXT_CHUNK_CHARS:
+            continue
+        metadata = ContentMetadata(page=page_numbers[idx], section="Text Content")
+        extracted_chunks.append(ExtractedChunk(
+            content_type="text",
+            text=chunk_text,
+            metadata=metadata
+        ))
+    return extracted_chunks, cut
+
+def extract_content_from_pdf(stream: BinaryIO) -> Iterator[List[ExtractedChunk]]:
+    """
+    Parses PDF to extract Text and Tables while preserving page context.
+    Reads the document from an open binary stream (e.g. UploadFile.file).
+    Yields the chunks of each page as it is parsed: its tables and images,
+    plus the text chunks completed so far.
+    Not thread-safe; advance it with next_page.
+    """
+    # Page texts are joined into a window that is split every few chunks'
+    # worth of text; the unfinished tail carries over to the next window, so
+    # chunk overlap still spans page breaks
+    window = ""
+    page_starts: List[int] = []
+    page_numbers: List[int] = []
     
-    with pdfplumber.open(file_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
+    with fitz.open(stream=stream.read(), filetype="pdf") as pdf:
+        for page_num, page in enumerate(pdf, start=1):
+            extracted_chunks: List[ExtractedChunk] = []
             
             # 1. Extract Tables
-            tables = page.extract_tables()
+            tables = [table.extract() for table in page.find_tables()]
             for table in tables:
                 # Store table content as a JSON string
-                # We use ensure_ascii=False to correctly handle Persian/UTF-8 characters
-                table_content = json.dumps(table, ensure_ascii=False)
+                # orjson emits UTF-8 directly, so Persian characters are kept as-is
+                table_content = orjson.dumps(table).decode()
                 metadata = ContentMetadata(page=page_num, section="Table Data")
                 
                 extracted_chunks.append(ExtractedChunk(
@@ -90,28 +229,29 @@ def extract_content_from_pdf(file_path: str) -> List[ExtractedChunk]:
                     metadata=metadata
                 ))
 
-            # 2. Extract Text (Recursive Character Splitting for contextual chunks)
-            text = page.extract_text()
-            if text:
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000, 
-                    chunk_overlap=100,
-                    separators=["\n\n", "\n", " ", ""] # Optimal separators for text flow
-                )
-                chunks = splitter.split_text(text)
-                
-                for chunk in chunks:
-                    metadata = ContentMetadata(page=page_num, section="Text Content")
-                    extracted_chunks.append(ExtractedChunk(
-                        content_type="text",
-                        text=chunk,
-                        metadata=metadata
-                    ))
+            # 2. Collect Text (Recursive Character Splitting for contextual chunks)
+            text = page.get_text("text")
+            if text.strip():
+                if window:
+                    window += PAGE_SEPARATOR
+                page_starts.append(len(window))
+                page_numbers.append(page_num)
+                window += text
+            if len(window) >= TEXT_WINDOW_CHARS:
+                text_chunks, cut = split_text_chunks(window, page_starts, page_numbers, final=False)
+                extracted_chunks.extend(text_chunks)
+                if cut:
+                    # Keep the page the carried-over tail starts on, rebased to 0
+                    idx = bisect_right(page_starts, cut) - 1
+                    window = window[cut:]
+                    page_starts = [0] + [start - cut for start in page_starts[idx + 1:]]
+                    page_numbers = page_numbers[idx:]
             
             # 3. Image Placeholder 
-            if page.images:
+            images = page.get_images()
+            if images:
                 # Use a counter for images on the same page
-                for idx, img in enumerate(page.images):
+                for idx, img in enumerate(images):
                     metadata = ContentMetadata(
                         page=page_num, 
                         section="Image Placeholder",
@@ -123,7 +263,318 @@ def extract_content_from_pdf(file_path: str) -> List[ExtractedChunk]:
                         metadata=metadata
                     ))
 
-    return extracted_chunks
+            yield extracted_chunks
+
+    # 4. Split the remaining text
+    if window:
+        yield split_text_chunks(window, page_starts, page_numbers, final=True)[0]
+
+def next_page(pages: Iterator[List[ExtractedChunk]]) -> Optional[List[ExtractedChunk]]:
+    """
+    Parses the next page of extract_content_from_pdf while holding
+    PDF_PARSE_LOCK. Returns None once the document is exhausted.
+    Blocking; call it from a worker thread.
+    """
+    with PDF_PARSE_LOCK:
+        return next(pages, None)
+
+def parse_all_pages(pages: Iterator[List[ExtractedChunk]]) -> List[ExtractedChunk]:
+    """Parses the rest of a document page by page (see next_page). Blocking."""
+    chunks: List[ExtractedChunk] = []
+    while (page_chunks := next_page(pages)) is not None:
+        chunks.extend(page_chunks)
+    return chunks
+
+def document_digest(stream: BinaryIO) -> str:
+    """SHA-256 of an uploaded file; the stream is rewound afterwards."""
+    digest = hashlib.sha256()
+    while block := stream.read(1 << 16):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def point_id(document_id: str, chunk_index: int) -> str:
+    """
+    Stable Qdrant point ID for a chunk of a document. Re-uploading the same
+    file (e.g. retrying after a failure part-way through) overwrites its points
+    instead of adding duplicates. Qdrant accepts the compact (dashless) UUID form.
+    """
+    return uuid.uuid5(uuid.UUID(document_id[:32]), str(chunk_index)).hex
+
+async def embed_texts(texts: List[str], cache: "OrderedDict[bytes, asyncio.Future]") -> np.ndarray:
+    """
+    Embeds texts, calling the API (under the semaphore shared by all requests)
+    only for texts not already in `cache`. The cache maps a digest of each text
+    to a future of its vector and is shared by the embed workers of one
+    document, so repeated text (page headers, footers, boilerplate) is embedded
+    once, even when repeats land in batches embedded concurrently. It keeps the
+    VECTOR_CACHE_SIZE most recently used texts.
+    Returns a float32 matrix with one row per input text.
+    """
+    loop = asyncio.get_running_loop()
+    futures: List[asyncio.Future] = []
+    # Texts first seen in this call, each with the future of its vector
+    pending: List[Tuple[str, asyncio.Future]] = []
+    for text in texts:
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        future = cache.get(key)
+        if future is None:
+            future = cache[key] = loop.create_future()
+            pending.append((text, future))
+        else:
+            cache.move_to_end(key)
+        futures.append(future)
+    # Evicted futures stay valid for the callers already holding them
+    while len(cache) > VECTOR_CACHE_SIZE:
+        cache.popitem(last=False)
+
+    if pending:
+        try:
+            async with embedding_semaphore:
+                vectors = await embedding_model.aembed_documents([text for text, _ in pending])
+        except BaseException:
+            # Workers waiting on these texts are stopped along with the pipeline
+            for _, future in pending:
+                future.cancel()
+            raise
+        for (_, future), vector in zip(pending, np.asarray(vectors, dtype=np.float32)):
+            future.set_result(vector)
+
+    return np.stack([await future for future in futures])
+
+async def set_indexing_threshold(threshold: int) -> None:
+    """Updates the collection's indexing threshold (0 disables HNSW indexing)."""
+    await async_qdrant_client.update_collection(
+        collection_name=COLLECTION_NAME,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=threshold)
+    )
+
+@asynccontextmanager
+async def paused_indexing() -> AsyncIterator[None]:
+    """
+    Pauses HNSW indexing for the duration of a bulk load, so the index is built
+    in one pass afterwards instead of alongside writes. Concurrent loads share
+    one pause: the first to start disables indexing, the last to finish
+    restores it.
+    """
+    global indexing_pauses
+    indexing_pauses += 1
+    try:
+        if indexing_pauses == 1:
+            await set_indexing_threshold(0)
+        yield
+    finally:
+        indexing_pauses -= 1
+        if indexing_pauses == 0:
+            await set_indexing_threshold(INDEXING_THRESHOLD)
+
+def upload_to_qdrant(records: Iterable[Tuple[str, Union[np.ndarray, List[float]], dict]]) -> None:
+    """
+    Uploads (id, vector, payload) records with qdrant_client.upload_collection,
+    which batches the stream and retries failed requests. The uploader turns
+    each vector back into a list before sending it, so array vectors only save
+    memory while records wait in the pipeline.
+    Blocking; call it from a worker thread.
+    """
+    # upload_collection takes ids, vectors and payloads as separate streams.
+    # It reads a batch worth of ids before any vectors, so tee buffers up to
+    # UPSERT_BATCH_SIZE records
+    id_stream, vector_stream, payload_stream = tee(records, 3)
+    qdrant_client.upload_collection(
+        collection_name=COLLECTION_NAME,
+        ids=(record[0] for record in id_stream),
+        vectors=(record[1] for record in vector_stream),
+        payload=(record[2] for record in payload_stream),
+        batch_size=UPSERT_BATCH_SIZE,
+        # parallel > 1 would start a fresh process pool on every call, which
+        # costs seconds per upload; the pipeline already overlaps the stages
+        parallel=1,
+        wait=True
+    )
+
+async def run_ingestion_pipeline(pages: Iterator[List[ExtractedChunk]], document_id: str) -> int:
+    """
+    Embeds and upserts a PDF's chunks, as yielded by extract_content_from_pdf,
+    as a pipeline of concurrent stages, so parsing, OpenAI calls and Qdrant
+    writes overlap. Memory stays bounded by the queued batches, the parser's
+    text window and the vector cache (see embed_texts), not the document size:
+
+        parse (worker thread) -> chunk_q -> embed workers -> upsert_q
+            -> upload_collection (worker thread)
+
+    Point IDs come from document_id and each chunk's position (see point_id).
+    HNSW indexing is paused during the load (see paused_indexing).
+    Returns the number of points upserted.
+    """
+    loop = asyncio.get_running_loop()
+    # Vectors of recently seen texts of this document (see embed_texts)
+    vector_cache: "OrderedDict[bytes, asyncio.Future]" = OrderedDict()
+    chunk_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upsert_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def parse_stage() -> None:
+        # Pages are parsed one at a time off the event loop (and one at a time
+        # across the service, see PDF_PARSE_LOCK); put() blocks while the embed
+        # workers are behind, which bounds memory. Batches carry the document
+        # index of their first chunk
+        batch: List[ExtractedChunk] = []
+        batch_start = 0
+        while (page_chunks := await asyncio.to_thread(next_page, pages)) is not None:
+            batch.extend(page_chunks)
+            while len(batch) >= PIPELINE_BATCH_SIZE:
+                await chunk_q.put((batch_start, batch[:PIPELINE_BATCH_SIZE]))
+                batch = batch[PIPELINE_BATCH_SIZE:]
+                batch_start += PIPELINE_BATCH_SIZE
+        if batch:
+            await chunk_q.put((batch_start, batch))
+        # One end-of-stream marker per embed worker
+        for _ in range(EMBEDDING_CONCURRENCY):
+            await chunk_q.put(None)
+
+    async def embed_worker() -> None:
+        while (item := await chunk_q.get()) is not None:
+            batch_start, batch = item
+            vectors = await embed_texts([chunk.text for chunk in batch], vector_cache)
+            # Records are queued column-wise: ids, one float32 matrix (a quarter
+            # the memory of lists of Python floats while queued), payloads.
+            # Unset optional fields such as related_images are left out
+            await upsert_q.put((
+                [point_id(document_id, batch_start + i) for i in range(len(batch))],
+                vectors,
+                [chunk.model_dump(exclude_none=True) for chunk in batch],
+            ))
+        await upsert_q.put(None)
+
+    upserted = 0
+
+    def iter_records() -> Iterator[Tuple[str, np.ndarray, dict]]:
+        # Runs in the upload thread, pulling record batches off the event loop's queue
+        nonlocal upserted
+        finished_workers = 0
+        while finished_workers < EMBEDDING_CONCURRENCY:
+            records = asyncio.run_coroutine_threadsafe(upsert_q.get(), loop).result()
+            if records is None:
+                finished_workers += 1
+                continue
+            ids, vectors, payloads = records
+            yield from zip(ids, vectors, payloads)
+            upserted += len(ids)
+
+    async def upload_stage() -> None:
+        # Holds one of the shared upload slots for the whole stream
+        async with upload_semaphore:
+            upload = asyncio.ensure_future(asyncio.to_thread(upload_to_qdrant, iter_records()))
+            try:
+                await asyncio.shield(upload)
+            except asyncio.CancelledError:
+                # The thread can't be cancelled; keep the slot until the
+                # failure path below has ended its stream and it returns
+                await asyncio.wait([upload])
+                raise
+
+    async with paused_indexing():
+        stages = [
+            asyncio.ensure_future(upload_stage()),
+            asyncio.ensure_future(parse_stage()),
+        ]
+        stages += [asyncio.ensure_future(embed_worker()) for _ in range(EMBEDDING_CONCURRENCY)]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            # If one stage fails, stop the others rather than leave them blocked.
+            # The upload thread can't be cancelled, so end its stream instead
+            for stage in stages:
+                stage.cancel()
+            while not upsert_q.empty():
+                upsert_q.get_nowait()
+            for _ in range(EMBEDDING_CONCURRENCY):
+                upsert_q.put_nowait(None)
+            # Wait for the upload thread to finish (see upload_stage), so no
+            # writes land after the indexing pause ends or the request fails
+            await asyncio.gather(*stages, return_exceptions=True)
+            raise
+    return upserted
+
+def batch_job_path(job_id: str) -> str:
+    """Location of the chunk payloads saved for a pending Batch API job."""
+    return os.path.join(BATCH_JOBS_DIR, f"{os.path.basename(job_id)}.json")
+
+async def submit_embedding_batch(chunks: List[ExtractedChunk], filename: str, document_id: str) -> str:
+    """
+    Submits a PDF's chunks to the OpenAI Batch API instead of embedding them
+    inline. The chunk payloads are saved under BATCH_JOBS_DIR until
+    /finalize/{job_id} upserts them with the returned vectors.
+    Returns the batch job ID.
+    """
+    # One embeddings request per chunk; custom_id maps results back to chunks
+    requests_jsonl = b"\n".join(
+        orjson.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/embeddings",
+            "body": {
+                "model": embedding_model.model,
+                "input": chunk.text,
+                "dimensions": EMBEDDING_DIMENSIONS,
+            },
+        })
+        for i, chunk in enumerate(chunks)
+    )
+    input_file = await openai_client.files.create(
+        file=(f"{filename}.jsonl", requests_jsonl),
+        purpose="batch"
+    )
+    batch = await openai_client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/embeddings",
+        completion_window="24h"
+    )
+
+    job = {
+        "filename": filename,
+        "document_id": document_id,
+        "payloads": [chunk.model_dump(exclude_none=True) for chunk in chunks],
+    }
+    os.makedirs(BATCH_JOBS_DIR, exist_ok=True)
+    with open(batch_job_path(batch.id), "wb") as job_file:
+        job_file.write(orjson.dumps(job))
+    return batch.id
+
+async def process_upload(file: UploadFile) -> VectorizeResponse:
+    """
+    Vectorizes one uploaded PDF: embeds and upserts it through the ingestion
+    pipeline, or hands documents with many chunks to the Batch API.
+    """
+    # The upload is already spooled by FastAPI, so it is parsed in place
+    await file.seek(0)
+    document_id = await asyncio.to_thread(document_digest, file.file)
+    pages = extract_content_from_pdf(file.file)
+
+    # When enabled, documents with many chunks go through the cheaper,
+    # asynchronous Batch API. The chunk count is only known once the whole
+    # document has been parsed, so it is parsed up front to count them
+    if BATCH_EMBEDDING_MIN_CHUNKS > 0:
+        chunks = await asyncio.to_thread(parse_all_pages, pages)
+        if len(chunks) >= BATCH_EMBEDDING_MIN_CHUNKS:
+            job_id = await submit_embedding_batch(chunks, file.filename, document_id)
+            return VectorizeResponse(
+                status="submitted",
+                message=f"Embedding batch job submitted. Call /finalize/{job_id} once it completes to upsert the chunks to Qdrant.",
+                filename=file.filename,
+                chunks_processed=0,
+                job_id=job_id
+            )
+        pages = iter([chunks])
+
+    # Embed and upsert as one streaming pipeline
+    chunks_processed = await run_ingestion_pipeline(pages, document_id)
+
+    return VectorizeResponse(
+        status="success", 
+        message=f"Successfully processed {chunks_processed} content chunks and upserted them to Qdrant.",
+        filename=file.filename,
+        chunks_processed=chunks_processed
+    )
 
 # --- API Endpoint ---
 
@@ -133,57 +584,107 @@ async def vectorize_pdf(file: UploadFile = File(...)):
     Endpoint to process PDF, embed content, and store in Qdrant.
     The response structure is validated by the VectorizeResponse model.
     """
-    file_location = f"/tmp/temp_{file.filename}"
     try:
-        # 1. Save uploaded file temporarily
-        with open(file_location, "wb+") as file_object:
-            file_object.write(await file.read())
-        
-        # 2. Parse PDF and chunk
-        chunks: List[ExtractedChunk] = extract_content_from_pdf(file_location)
-        
-        points = []
-        
-        # 3. Generate Embeddings & Prepare for Qdrant
-        # Extract all text for batch embedding (more efficient)
-        texts = [chunk.text for chunk in chunks]
-        vectors = embedding_model.embed_documents(texts)
-        
-        for i, vector in enumerate(vectors):
-            chunk = chunks[i]
-            
-            # Convert Pydantic model to a standard dict for the Qdrant payload
-            payload = chunk.model_dump()
-            
-            points.append(PointStruct(
-                id=str(uuid.uuid4()), 
-                vector=vector,        
-                payload=payload       
-            ))
+        return await process_upload(file)
 
-        # 4. Upsert to Qdrant
-        if points:
-            qdrant_client.upsert(
-                collection_name=COLLECTION_NAME,
-                points=points,
-                wait=True
+    except Exception as e:
+        logger.error(f"Error processing PDF: {str(e)}")
+        # Raise an HTTPException to ensure a proper error response is returned
+        raise HTTPException(
+            status_code=500, 
+            detail=f"An internal error occurred during vectorization: {str(e)}"
+        )
+
+@app.post("/vectorize_batch", response_model=List[VectorizeResponse])
+async def vectorize_pdf_batch(files: List[UploadFile] = File(...)):
+    """
+    Endpoint to process several PDFs in one request. The files are ingested
+    concurrently, sharing the service-wide OpenAI and Qdrant semaphores;
+    their pages are still parsed one at a time (see PDF_PARSE_LOCK).
+    Returns one VectorizeResponse per file, in upload order; a file that
+    fails gets an 'error' response instead of failing the whole request.
+    """
+    async def _one(file: UploadFile) -> VectorizeResponse:
+        try:
+            return await process_upload(file)
+        except Exception as e:
+            logger.error(f"Error processing PDF {file.filename}: {str(e)}")
+            return VectorizeResponse(
+                status="error",
+                message=f"An internal error occurred during vectorization: {str(e)}",
+                filename=file.filename,
+                chunks_processed=0
+            )
+
+    return await asyncio.gather(*[_one(file) for file in files])
+
+@app.post("/finalize/{job_id}", response_model=VectorizeResponse)
+async def finalize_batch(job_id: str):
+    """
+    Endpoint to finish a Batch API job started by /vectorize: once the job has
+    finished, its vectors are paired with the saved chunks and upserted.
+    Expired and cancelled jobs still return the requests they completed, so
+    those are upserted too. Until then the current job status is returned.
+    """
+    job_path = batch_job_path(job_id)
+    if not os.path.exists(job_path):
+        raise HTTPException(status_code=404, detail=f"Unknown batch job: {job_id}")
+
+    try:
+        with open(job_path, "rb") as job_file:
+            job = orjson.loads(job_file.read())
+
+        batch = await openai_client.batches.retrieve(job_id)
+        finished = batch.status in ("completed", "expired", "cancelled")
+        if batch.status == "failed" or (finished and not batch.output_file_id):
+            # The job will never produce vectors, so drop its saved chunks
+            os.remove(job_path)
+        if not finished or not batch.output_file_id:
+            return VectorizeResponse(
+                status=batch.status,
+                message=f"Embedding batch job is {batch.status}; no chunks were upserted.",
+                filename=job["filename"],
+                chunks_processed=0,
+                job_id=job_id
             )
 
+        # Results come back in arbitrary order, keyed by custom_id. Failed
+        # requests, and those an expired or cancelled job never ran, have no
+        # result here and are skipped
+        vectors = {}
+        output = await openai_client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            result = orjson.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") == 200:
+                vectors[int(result["custom_id"])] = response["body"]["data"][0]["embedding"]
+
+        payloads = job["payloads"]
+        embedded = [i for i in range(len(payloads)) if i in vectors]
+        # Vectors stay as the API returned them; rounding to float32 would
+        # only lengthen their JSON on the way to Qdrant
+        records = zip(
+            [point_id(job["document_id"], i) for i in embedded],
+            [vectors[i] for i in embedded],
+            [payloads[i] for i in embedded],
+        )
+
+        async with paused_indexing(), upload_semaphore:
+            await asyncio.to_thread(upload_to_qdrant, records)
+        os.remove(job_path)
+
+        skipped = len(payloads) - len(embedded)
         return VectorizeResponse(
-            status="success", 
-            message=f"Successfully processed {len(points)} content chunks and upserted them to Qdrant.",
-            filename=file.filename,
-            chunks_processed=len(points)
+            status="success",
+            message=f"Successfully upserted {len(embedded)} content chunks to Qdrant ({skipped} were not embedded by the {batch.status} batch job).",
+            filename=job["filename"],
+            chunks_processed=len(embedded),
+            job_id=job_id
         )
 
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
-        # Raise an HTTPException to ensure a proper error response is returned
+        logger.error(f"Error finalizing batch job {job_id}: {str(e)}")
         raise HTTPException(
             status_code=500, 
-            detail=f"An internal error occurred during vectorization: {str(e)}"
+            detail=f"An internal error occurred while finalizing the batch job: {str(e)}"
         )
-    finally:
-        # Cleanup
-        if os.path.exists(file_location):
-            os.remove(file_location)
\ No newline at end of file
@@ -21,7 +21,8 @@ class ExtractedChunk(BaseModel):
 
 class VectorizeResponse(BaseModel):
     """The structured response model for the /vectorize endpoint."""
-    status: str = Field(..., description="Status of the operation, e.g., 'success' or 'error'.")
+    status: str = Field(..., description="Status of the operation: 'success', 'error', 'submitted' (embedding deferred to a Batch API job), or, from /finalize, the status of a batch job that has not produced vectors (e.g., 'in_progress', 'failed').")
     message: str = Field(..., description="A human-readable message about the result.")
     filename: str = Field(..., description="The name of the processed PDF file.")
-    chunks_processed: int = Field(..., description="The total number of chunks successfully processed and upserted.")
\ No newline at end of file
+    chunks_processed: int = Field(..., description="The total number of chunks successfully processed and upserted.")
+    job_id: Optional[str] = Field(None, description="OpenAI Batch API job ID, set when embedding was deferred to a batch job.")
\ No newline at end of file
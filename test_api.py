@@ -36,6 +36,10 @@ def test_vectorize_endpoint():
             print("-----------------------------")
             print(response.json())
             print("-----------------------------")
+            # Large PDFs are embedded by an OpenAI batch job and finalized later
+            job_id = response.json().get("job_id")
+            if job_id:
+                print(f"ℹ️  Batch job submitted. Once it completes, run: curl -X POST {API_URL.rsplit('/', 1)[0]}/finalize/{job_id}")
         else:
             print(f"\n⚠️ Request failed with status code: {response.status_code}")
             print("Response details:")